@@ -3,33 +3,26 @@
 from __future__ import print_function
 
 from argparse import ArgumentParser
-import json
 
-import dateutil
-import pandas
-import numpy
+import dateutil.parser
 
-from jenkins._common import BASE_DIR
-from jenkins._analysis import (
-    analyze_failing_tests,
-    get_daily_time_to_merge,
+from jenkins._common import ArtifactManifest
+from jenkins._snapshot import find_latest_snapshot, iter_snapshot
+from jenkins._summary import (
     get_datetime,
-    get_classified_failures,
-    get_daily_classification_pivot,
-    get_top_failing_jobs,
-    group_by_classification,
-    group_by_test_name,
-    make_build_data_frame,
-    make_subbuild_data_frame,
     summarize_build_results,
-    summarize_weekly_stats,
+    summarize_builds,
 )
 
+# pandas, numpy and jenkins._analysis are slow to import, so they are only
+# imported by the report sections that need them. That keeps ``--quick``
+# fast enough for cron jobs and shell prompts.
+
 
 def builds_since(builds, since):
     """
-    Filter a list of builds to only those newer than the
-    provided timestamp.
+    Filter builds to only those newer than the provided
+    timestamp, lazily.
 
     :param Iterable[dict]: an iterable of dicts of build
         data.
@@ -38,31 +31,43 @@ def builds_since(builds, since):
     :return Iterable[dict]: an iterable containing only the
         records in `builds` that are newer than `since`.
     """
-    return filter(
-        lambda b: get_datetime(b['timestamp']) > since,
-        builds)
+    return (b for b in builds if get_datetime(b['timestamp']) > since)
 
 
 def load_build_data(since=None):
     """
-    Load the build data.
+    Load the build data from the latest snapshot.
+
+    Builds are read one at a time and filtered as they are read, so only
+    the selected builds are ever held in memory.
 
     :param Optional[datetime] since: only builds newer than this datetime
            will be included if this is provided.
-    :return Iterable[dict]: an iterable of build records.
+    :return Iterator[dict]: an iterator of build records.
     """
-    info_files = BASE_DIR.globChildren('api.*.json')
-    assert info_files, "Haven't downloaded any data"
-    info_files.sort(key=lambda x: x.path)
-    api_data = info_files[-1]
-    with api_data.open() as f:
-        builds = json.load(f)['builds']
-        if since:
-            builds = builds_since(builds, since)
-        return builds
+    api_data = find_latest_snapshot()
+    assert api_data is not None, "Haven't downloaded any data"
+    builds = iter_snapshot(api_data)
+    if since:
+        builds = builds_since(builds, since)
+    return builds
+
+
+def print_quick_summary(builds):
+    results, failing_jobs = summarize_builds(builds)
+    print("Top-level build results:")
+    print(results)
+    print("")
+    print("")
+    print("Jobs with the most failures")
+    for job, count in failing_jobs.most_common(20):
+        print(job, count)
 
 
 def print_summary_results(builds):
+    from jenkins._analysis import (
+        make_build_data_frame, summarize_weekly_stats,
+    )
     print("Top-level build results:")
     print(summarize_build_results(builds))
     print("")
@@ -72,27 +77,43 @@ def print_summary_results(builds):
 
 
 def print_top_failing_jobs(build_data):
+    from jenkins._analysis import get_top_failing_jobs
     print("Jobs with the most failures")
     failing_jobs = get_top_failing_jobs(build_data)
     print(failing_jobs.head(20))
 
 
 def print_common_failure_reasons(classified_failure_data):
+    from jenkins._analysis import group_by_classification
     print("Classification of failures")
     print(group_by_classification(classified_failure_data))
 
 
 def print_common_failure_daily(classified_failure_data):
+    from jenkins._analysis import get_daily_classification_pivot
     print("Daily drill-down on failure classifications:")
     print(get_daily_classification_pivot(classified_failure_data))
 
 
-def print_commonly_failing_tests(build_data):
+def print_unknown_failure_clusters(classified_failure_data, manifest):
+    from jenkins._analysis import cluster_unknown_failures
+    print("Largest clusters of unclassified failures")
+    clusters = cluster_unknown_failures(classified_failure_data, manifest)
+    for cluster in clusters.head(10).itertuples():
+        print("")
+        print("{} failures, e.g. {}".format(cluster.size, cluster.urls[0]))
+        print(cluster.excerpt)
+
+
+def print_commonly_failing_tests(build_data, manifest):
+    from jenkins._analysis import analyze_failing_tests, group_by_test_name
     print("Tests with the most failures")
-    print(group_by_test_name(analyze_failing_tests(build_data)).head(20))
+    failing_tests = analyze_failing_tests(build_data, manifest)
+    print(group_by_test_name(failing_tests).head(20))
 
 
 def print_daily_time_to_merge(build_data):
+    from jenkins._analysis import get_daily_time_to_merge
     print("Approximation of time-to-merge across days:")
     print(get_daily_time_to_merge(build_data))
 
@@ -105,12 +126,25 @@ def main():
         '--since', type=dateutil.parser.parse,
         help="Only consider builds since this date"
     )
+    parser.add_argument(
+        '--quick', action='store_true',
+        help="Only print build results and failing jobs, without pandas"
+    )
     opts = parser.parse_args()
     builds = load_build_data(since=opts.since)
 
-    pandas.set_option('expand_frame_repr', False)
     print("Showing data since: ", opts.since)
     print("")
+    if opts.quick:
+        print_quick_summary(builds)
+        return
+
+    builds = list(builds)
+    import pandas
+    from jenkins._analysis import (
+        get_classified_failures, make_subbuild_data_frame,
+    )
+    pandas.set_option('expand_frame_repr', False)
     print_summary_results(builds)
     print("")
     print("")
@@ -118,14 +152,18 @@ def main():
     print_top_failing_jobs(build_data)
     print("")
     print("")
-    classified_failure_data = get_classified_failures(build_data)
+    manifest = ArtifactManifest.load()
+    classified_failure_data = get_classified_failures(build_data, manifest)
     print_common_failure_reasons(classified_failure_data)
     print("")
     print("")
     print_common_failure_daily(classified_failure_data)
     print("")
     print("")
-    print_commonly_failing_tests(build_data)
+    print_unknown_failure_clusters(classified_failure_data, manifest)
+    print("")
+    print("")
+    print_commonly_failing_tests(build_data, manifest)
     print("")
     print("")
     print_daily_time_to_merge(build_data)
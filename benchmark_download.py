@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+Benchmark how the downloader's disk writes affect its throughput.
+
+Runs the downloader's fetch path (``fetch_failure_data``, ``get_console_text``,
+``get_test_report`` and treq) for many large logs at once, with only
+``jenkins_get`` replaced by a stub. The stub delivers each log in chunks from
+the reactor, so while the reactor is blocked writing a file, every other
+transfer stalls, as it would with real connections.
+
+Each round downloads the logs once saving them on the reactor thread and once
+through DiskWriter, each into a fresh directory. The order alternates between
+rounds, so that neither variant always benefits from running second.
+
+On a fast local disk most writes only reach the page cache. Use
+``--write-latency`` to add a fixed delay to each write and emulate slower
+storage, such as a network filesystem.
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from functools import partial
+import sys
+import tempfile
+import time
+
+from twisted.internet import defer
+from twisted.internet.task import react
+from twisted.python.failure import Failure
+from twisted.python.filepath import FilePath
+from twisted.web.client import ResponseDone
+from twisted.web.http_headers import Headers
+
+import jenkins._common
+import jenkins._jenkins
+from jenkins._common import ArtifactManifest
+import download_data
+from download_data import (
+    DiskWriter, MAX_CONCURRENT_REQUESTS, fetch_failure_data,
+)
+
+
+class FakeResponse(object):
+    """
+    A response whose body arrives in ``chunks`` pieces, ``chunk_delay``
+    seconds apart.
+    """
+
+    def __init__(self, reactor, code, body, chunks, chunk_delay):
+        self.code = code
+        self.headers = Headers()
+        self.length = len(body)
+        self._reactor = reactor
+        self._body = body
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+
+    def deliverBody(self, protocol):
+        size = -(-len(self._body) // self._chunks)
+        pieces = [self._body[i:i + size]
+                  for i in range(0, len(self._body), size)]
+
+        def deliver():
+            if pieces:
+                protocol.dataReceived(pieces.pop(0))
+                self._reactor.callLater(self._chunk_delay, deliver)
+            else:
+                protocol.connectionLost(Failure(ResponseDone()))
+        self._reactor.callLater(self._chunk_delay, deliver)
+
+
+def fake_jenkins_get(reactor, log, chunks, chunk_delay, path, headers=None):
+    """
+    Respond with ``log`` for console logs, and with a 404 for test reports.
+    """
+    if path.endswith('/consoleText'):
+        return defer.succeed(
+            FakeResponse(reactor, 200, log, chunks, chunk_delay))
+    return defer.succeed(FakeResponse(reactor, 404, b'', chunks, chunk_delay))
+
+
+def slow_save_artifact(save_artifact, latency, *args):
+    """
+    Save an artifact and then wait, like a write to slow storage would.
+    """
+    save_artifact(*args)
+    time.sleep(latency)
+
+
+class InlineWriter(object):
+    """
+    Save downloaded data on the reactor thread, like the downloader did
+    before it had DiskWriter.
+    """
+
+    def run(self, f, *args):
+        return defer.maybeDeferred(f, *args)
+
+    def fetch_and_save(self, fetch, save, url):
+        return fetch(url).addCallback(save, url)
+
+
+@defer.inlineCallbacks
+def download(writer, count):
+    """
+    Download ``count`` logs into a fresh directory.
+
+    :return Deferred[float]: the number of seconds it took.
+    """
+    base = FilePath(tempfile.mkdtemp())
+    # get_log_path looks this up each time it is called.
+    jenkins._common.BASE_DIR = base
+    logs = base.child('logs')
+    logs.makedirs()
+    manifest = ArtifactManifest.load(logs)
+    sem = defer.DeferredSemaphore(MAX_CONCURRENT_REQUESTS)
+    try:
+        start = time.time()
+        yield defer.gatherResults([
+            fetch_failure_data(
+                sem, writer, manifest, 'job/bench/{}/'.format(i))
+            for i in range(count)
+        ])
+        defer.returnValue(time.time() - start)
+    finally:
+        base.remove()
+
+
+def throughput(count, size, elapsed):
+    """
+    :return float: the throughput in MiB/s.
+    """
+    return count * size / 2.0 ** 20 / elapsed
+
+
+@defer.inlineCallbacks
+def main(reactor, *argv):
+    parser = ArgumentParser(
+        'benchmark_download.py',
+        description="Benchmark the downloader's disk writes"
+    )
+    parser.add_argument(
+        '--count', type=int, default=100, help="The number of logs to fetch")
+    parser.add_argument(
+        '--size', type=int, default=16, help="The size of each log, in MiB")
+    parser.add_argument(
+        '--chunks', type=int, default=256,
+        help="The number of chunks each log arrives in")
+    parser.add_argument(
+        '--chunk-delay', type=float, default=0.001,
+        help="The time each chunk takes to arrive, in seconds")
+    parser.add_argument(
+        '--rounds', type=int, default=3,
+        help="The number of times to run each variant")
+    parser.add_argument(
+        '--write-latency', type=float, default=0,
+        help="Extra time each write takes, in seconds")
+    opts = parser.parse_args(argv)
+
+    size = opts.size * 2 ** 20
+    jenkins._jenkins.jenkins_get = partial(
+        fake_jenkins_get, reactor, b'x' * size, opts.chunks, opts.chunk_delay)
+    if opts.write_latency:
+        download_data._save_artifact = partial(
+            slow_save_artifact, download_data._save_artifact,
+            opts.write_latency)
+
+    disk_writer = DiskWriter(reactor)
+    disk_writer.start()
+    variants = [('inline', InlineWriter()), ('writer-pool', disk_writer)]
+    results = dict((name, []) for name, _ in variants)
+    for i in range(opts.rounds):
+        for name, writer in variants[i % 2:] + variants[:i % 2]:
+            elapsed = yield download(writer, opts.count)
+            results[name].append(throughput(opts.count, size, elapsed))
+
+    print("")
+    print("{} logs of {} MiB, {} chunks {}s apart, {}s write latency:".format(
+        opts.count, opts.size, opts.chunks, opts.chunk_delay,
+        opts.write_latency))
+    for name, _ in variants:
+        print("{:12} {} MiB/s (median {:.1f})".format(
+            name,
+            ', '.join('{:.1f}'.format(t) for t in results[name]),
+            sorted(results[name])[len(results[name]) // 2]))
+
+
+if __name__ == '__main__':
+    react(main, sys.argv[1:])
@@ -3,84 +3,178 @@
 
 from __future__ import print_function
 
-import datetime
+import errno
 from functools import partial
-import json
 
 from twisted.internet import defer
 from twisted.internet.task import react
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
 
-from jenkins._analysis import make_subbuild_data_frame
-from jenkins._common import BASE_DIR, FAILURE, get_log_path
+from jenkins._common import (
+    BASE_DIR, CONSOLE_TEXT, FAILURE, TEST_REPORT, ArtifactManifest,
+    get_log_path,
+)
 from jenkins._jenkins import (
     jenkins_json_get, get_console_text, get_test_report,
 )
+from jenkins._snapshot import new_snapshot_path, write_snapshot
 
 
 MAX_CONCURRENT_REQUESTS = 10
 
+# The number of threads that write downloaded data to disk.
+WRITER_THREADS = 4
 
-def save_log(log, url):
-    if log is None:
-        return
-    dir = get_log_path(url)
-    if not dir.exists():
-        dir.makedirs()
-    f = dir.child('consoleText')
-    f.setContent(log)
+# The number of downloads that can be in progress or waiting to be written
+# to disk. Once this many are outstanding, no more are started until some
+# have been written.
+MAX_PENDING_WRITES = 20
 
 
-def save_test_report(data, url):
-    # XXX: Duplication w/ save_log
+def _save_artifact(manifest, name, data, url):
     if data is None:
+        manifest.record(url, name, None)
         return
     dir = get_log_path(url)
-    if not dir.exists():
+    try:
         dir.makedirs()
-    f = dir.child('testReport')
-    f.setContent(data)
+    except OSError as e:
+        # The other artifact of the same build may be being saved by
+        # another writer thread.
+        if e.errno != errno.EEXIST:
+            raise
+    dir.child(name).setContent(data)
+    manifest.record(url, name, len(data))
 
 
-def fetch_failure_data(sem, url):
-    console = sem.run(get_console_text, url)
-    console.addCallback(lambda x: print(url) or x)
-    console.addCallback(save_log, url)
+def save_log(manifest, log, url):
+    _save_artifact(manifest, CONSOLE_TEXT, log, url)
 
-    test = sem.run(get_test_report, url)
-    test.addCallback(save_test_report, url)
 
-    return defer.gatherResults([console, test])
+def save_test_report(manifest, data, url):
+    _save_artifact(manifest, TEST_REPORT, data, url)
+
+
+class DiskWriter(object):
+    """
+    Save downloaded data from a pool of threads, so that the reactor carries
+    on processing responses while a large log is being written.
+
+    Writes that fall behind hold up the start of new downloads, rather than
+    letting downloaded data pile up in memory.
+    """
+
+    def __init__(self, reactor, threads=WRITER_THREADS,
+                 max_pending=MAX_PENDING_WRITES):
+        self._reactor = reactor
+        self._pool = ThreadPool(
+            minthreads=0, maxthreads=threads, name='disk-writer')
+        self._pending = defer.DeferredSemaphore(max_pending)
+
+    def start(self):
+        """
+        Start the writer threads. They are stopped when the reactor stops.
+        """
+        self._pool.start()
+        self._reactor.addSystemEventTrigger(
+            'during', 'shutdown', self._pool.stop)
+
+    def run(self, f, *args):
+        """
+        Call a blocking function in the writer pool.
+
+        :return Deferred: fires with the result of ``f(*args)``.
+        """
+        return deferToThreadPool(self._reactor, self._pool, f, *args)
+
+    def fetch_and_save(self, fetch, save, url):
+        """
+        Fetch the data for a url, then save it from the writer pool.
+
+        :param fetch: a function that takes ``url`` and returns a Deferred
+            that fires with data.
+        :param save: a function that takes the data and ``url`` and writes
+            the data to disk.
+        :param str url: the url to fetch the data for.
+        :return Deferred: fires once the data has been written.
+        """
+        def fetch_then_save():
+            d = fetch(url)
+            d.addCallback(lambda data: self.run(save, data, url))
+            return d
+        return self._pending.run(fetch_then_save)
+
+
+def fetch_failure_data(sem, writer, manifest, url):
+    """
+    Download the artifacts of a failed build that haven't been downloaded
+    already. The artifacts of a finished build never change, so once they
+    are in the manifest they aren't requested again.
+    """
+    def fetch_console_text(url):
+        d = sem.run(get_console_text, url)
+        d.addCallback(lambda x: print(url) or x)
+        return d
+
+    downloads = []
+    if not manifest.is_recorded(url, CONSOLE_TEXT):
+        downloads.append(writer.fetch_and_save(
+            fetch_console_text, partial(save_log, manifest), url))
+    if not manifest.is_recorded(url, TEST_REPORT):
+        downloads.append(writer.fetch_and_save(
+            partial(sem.run, get_test_report),
+            partial(save_test_report, manifest), url))
+
+    def report_failures(results):
+        for success, result in results:
+            if not success:
+                print("Failed to download", url, result.getErrorMessage())
+    # Wait for every download, even if one fails, so that the reactor isn't
+    # stopped while the others are still in progress.
+    d = defer.DeferredList(downloads, consumeErrors=True)
+    d.addCallback(report_failures)
+    return d
 
 
-def _get_failure_urls(api_json_data):
+def _get_failure_urls(builds):
     """
-    Given Jenkins data for a build, return the URLs of the failed sub-builds.
+    Given Jenkins data for some builds, return the URLs of the failed
+    sub-builds.
     """
-    builds = api_json_data['builds']
-    build_data = make_subbuild_data_frame(builds)
-    individual_failures = build_data[build_data['result'] == FAILURE]
-    return individual_failures['url']
+    return [
+        sub_build['url']
+        for build in builds
+        for sub_build in build['subBuilds']
+        if sub_build['result'] == FAILURE
+    ]
 
 
 def main(reactor):
-    if not BASE_DIR.exists():
-        BASE_DIR.makedirs()
+    logs = BASE_DIR.child('logs')
+    if not logs.exists():
+        logs.makedirs()
+    manifest = ArtifactManifest.load(logs)
+    writer = DiskWriter(reactor)
+    writer.start()
     base_path = 'job/ClusterHQ-flocker/job/master/job/__main_multijob/'
     d = jenkins_json_get(
         base_path + 'api/json?tree=builds[result,number,timestamp,duration,'
-        'subBuilds[result,buildNumber,jobName,url,timestamp,duration]]')
+        'subBuilds[result,buildNumber,jobName,url,timestamp,duration]]',
+        run_io=writer.run)
 
     def write_main_data(data):
-        filename = 'api.' + datetime.datetime.utcnow().isoformat() + '.json'
-        json.dump(data, BASE_DIR.child(filename).open('wb'))
-        return data
+        builds = data['builds']
+        d = writer.run(write_snapshot, builds, new_snapshot_path())
+        return d.addCallback(lambda _: builds)
     d.addCallback(write_main_data)
 
     d.addCallback(_get_failure_urls)
 
     def download_failed_logs(urls):
         sem = defer.DeferredSemaphore(MAX_CONCURRENT_REQUESTS)
-        deferreds = map(partial(fetch_failure_data, sem), urls)
+        deferreds = map(
+            partial(fetch_failure_data, sem, writer, manifest), urls)
         return defer.DeferredList(deferreds)
 
     d.addCallback(download_failed_logs)
@@ -1,7 +1,7 @@
 # Copyright (c) ClusterHQ Ltd. See LICENSE for details.
 
-import collections
 import datetime
+import errno
 import json
 
 import numpy
@@ -14,23 +14,23 @@ from ._common import (
     PASSED,
     SKIPPED,
     FIXED,
+    CONSOLE_TEXT,
+    TEST_REPORT,
+    ArtifactManifest,
     get_log_path,
 )
+from ._fingerprint import cluster_signatures, fingerprint, log_tail
+from ._summary import get_datetime
 
 
-def _get_build_result(build):
-    """
-    Aggregate all the results of the sub-builds of a build.
-    """
-    results = set(sub['result'] for sub in build['subBuilds'] if sub['result'])
-    if results == set([SUCCESS]):
-        return SUCCESS
-    else:
-        return FAILURE
+UNKNOWN = "Unknown"
+MISSING_LOG = "Missing log"
 
+# The number of lines of a representative log shown for each cluster.
+EXCERPT_LINES = 10
 
-def summarize_build_results(builds):
-    return collections.Counter(map(_get_build_result, builds))
+# The file next to a console log that unknown failures are fingerprinted to.
+FINGERPRINT_FILE = 'fingerprint.json'
 
 
 def summarize_weekly_stats(builds):
@@ -125,7 +125,8 @@ def make_subbuild_data_frame(builds):
     the top level builds.
 
     :param Iterable[dict] builds: an iterable of
-        dicts of build information.
+        dicts of build information. This is only
+        iterated once, so it can be a generator.
     :return pandas.DataFrame: a DataFrame containing
         that data.
     """
@@ -203,18 +204,7 @@ def _classify_build_log(log, path):
     if '\nerror: flocker.' in log:
         return "Failed Test"
     print "Unknown failure reason:", path.path
-    return "Unknown"
-
-
-def get_datetime(timestamp):
-    """
-    Return the datetime from a jenkins timestamp.
-
-    :param int timestamp: The timestamp to convert in ms since utc
-        to a datetime
-    :return datetime: The corresponding datetime.
-    """
-    return datetime.datetime.fromtimestamp(float(timestamp)/1000)
+    return UNKNOWN
 
 
 def _get_week_number(timestamp):
@@ -256,7 +246,7 @@ def _make_week_numbers(builds):
     return builds['timestamp'].map(_get_week_number)
 
 
-def _classify(url):
+def _classify(url, manifest):
     """
     Classify the failure of a url.
 
@@ -264,18 +254,83 @@ def _classify(url):
     consoleText and tries to provide the best classification.
 
     :param str url: a url of a build.
+    :param ArtifactManifest manifest: the artifacts that are available.
     :return str: the classification.
     """
-    path = get_log_path(url).child('testReport')
-    if path.exists():
+    if manifest.has(url, TEST_REPORT):
         return "Failed Test"
-    else:
-        path = get_log_path(url).child('consoleText')
-        if path.exists():
+    elif manifest.has(url, CONSOLE_TEXT):
+        path = get_log_path(url).child(CONSOLE_TEXT)
+        try:
             with path.open() as f:
-                return _classify_build_log(f.read(), path)
-        else:
-            return "Missing log"
+                log = f.read()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # The log has been removed since it was downloaded.
+            manifest.forget(url, CONSOLE_TEXT)
+            return MISSING_LOG
+        classification = _classify_build_log(log, path)
+        if (classification == UNKNOWN and
+                not path.sibling(FINGERPRINT_FILE).exists()):
+            # Fingerprint the log while it is in memory, so that clustering
+            # doesn't have to read it again.
+            _fingerprint_log(url, log)
+        return classification
+    else:
+        return MISSING_LOG
+
+
+def _fingerprint_log(url, log):
+    """
+    Fingerprint the console log of a build, and save the fingerprint next
+    to the log.
+
+    :param str url: a url of a build.
+    :param str log: the text of its console log.
+    :return Tuple[str, tuple[int]]: an excerpt from the end of the log and
+        the fingerprint of the log.
+    """
+    # Logs aren't necessarily UTF-8, but the excerpt has to be to go in
+    # JSON.
+    excerpt = '\n'.join(log_tail(log, EXCERPT_LINES)).decode(
+        'utf-8', 'replace')
+    signature = fingerprint(log)
+    get_log_path(url).child(FINGERPRINT_FILE).setContent(
+        json.dumps({'excerpt': excerpt, 'signature': signature}))
+    return excerpt.encode('utf-8'), signature
+
+
+def _get_log_fingerprint(url, manifest):
+    """
+    Get the fingerprint of the console log of a build, computing it if it
+    wasn't saved when the build was classified.
+
+    :param str url: a url of a build.
+    :param ArtifactManifest manifest: the artifacts that are available.
+    :return Optional[Tuple[str, tuple[int]]]: an excerpt from the end of the
+        log and the fingerprint of the log, or ``None`` if the log isn't
+        available.
+    """
+    if not manifest.has(url, CONSOLE_TEXT):
+        return None
+    path = get_log_path(url)
+    try:
+        with path.child(FINGERPRINT_FILE).open() as f:
+            saved = json.load(f)
+        return saved['excerpt'].encode('utf-8'), tuple(saved['signature'])
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    try:
+        with path.child(CONSOLE_TEXT).open() as f:
+            log = f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        manifest.forget(url, CONSOLE_TEXT)
+        return None
+    return _fingerprint_log(url, log)
 
 
 def _test_case_name(case):
@@ -296,31 +351,47 @@ def _get_failing_tests(test_report):
     return list(filter(_test_case_failed, _list_tests(test_report)))
 
 
-def analyze_failing_tests(build_data):
+def analyze_failing_tests(build_data, manifest=None):
     """
     Given a DataFrame of build data, analyse which
     individaul tests are failing the builds.
 
     :param pandas.DataFrame build_data: the build data to
         analyze.
+    :param Optional[ArtifactManifest] manifest: the
+        artifacts that are available. The manifest of the
+        log directory is loaded if this isn't provided.
     :return pandas.DataFrame: a new DataFrame with
-        information about individual failing tests.
+        information about individual failing tests,
+        including the url of the build they failed in.
     """
     individual_failures = build_data[build_data['result'] == FAILURE]
+    if manifest is None:
+        manifest = ArtifactManifest.load()
 
     failing_cases = []
     for url in individual_failures['url']:
-        path = get_log_path(url).child('testReport')
-        if path.exists():
-            with path.open() as f:
-                tests = json.load(f)
-                failing_cases.extend(_get_failing_tests(tests))
-
+        if manifest.has(url, TEST_REPORT):
+            try:
+                with get_log_path(url).child(TEST_REPORT).open() as f:
+                    tests = json.load(f)
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                # The report has been removed since it was downloaded.
+                manifest.forget(url, TEST_REPORT)
+                continue
+            failing_cases.extend(
+                dict(case, url=url) for case in _get_failing_tests(tests))
+
+    if not failing_cases:
+        return pandas.DataFrame(
+            columns=['url', 'className', 'name', 'test_case_name'])
     failing_frame = pandas.DataFrame(failing_cases)
     return failing_frame.assign(test_case_name=_test_case_name)
 
 
-def get_classified_failures(build_data):
+def get_classified_failures(build_data, manifest=None, classify=_classify):
     """
     Given a DataFrame of build data, guess what caused
     each failure. Return a DataFrame including a new
@@ -329,13 +400,21 @@ def get_classified_failures(build_data):
 
     :param pandas.DataFrame build_data: a DataFrame with
         information about jobs.
+    :param Optional[ArtifactManifest] manifest: the
+        artifacts that are available. The manifest of the
+        log directory is loaded if this isn't provided.
+    :param classify: a function that classifies the failure
+        of a url, given the url and the manifest.
     :return pandas.DataFrame: a new DataFrame with a row
         for each failing build in the input frame, and
         an additional column describing the failure reason.
     """
     individual_failures = build_data[build_data['result'] == FAILURE]
+    if manifest is None:
+        manifest = ArtifactManifest.load()
 
-    classifications = individual_failures['url'].map(_classify)
+    classifications = individual_failures['url'].map(
+        lambda url: classify(url, manifest))
     individual_failures.insert(3, 'classification', classifications)
     return individual_failures
 
@@ -488,3 +567,42 @@ def group_by_test_name(failures):
     return failures.groupby('test_case_name').size().sort_values(
         ascending=False)
 
+
+def cluster_unknown_failures(failures, manifest=None):
+    """
+    Given a DataFrame of classified failures, group the failures that
+    couldn't be classified by the similarity of the end of their logs.
+
+    :param pandas.DataFrame failures: the DataFrame with classified failures.
+    :param Optional[ArtifactManifest] manifest: the artifacts that are
+        available. The manifest of the log directory is loaded if this
+        isn't provided.
+    :return pandas.DataFrame: a DataFrame with a row for each cluster, the
+        largest first, with the number of failures in the cluster, the urls
+        of those failures and an excerpt from the log of one of them.
+    """
+    unknown = failures[failures['classification'] == UNKNOWN]
+    if manifest is None:
+        manifest = ArtifactManifest.load()
+
+    excerpts = {}
+    signatures = {}
+    for url in unknown['url']:
+        # Only the excerpt is kept, not the whole log, so that memory use
+        # doesn't grow with the size of the logs.
+        log_fingerprint = _get_log_fingerprint(url, manifest)
+        if log_fingerprint is not None:
+            excerpts[url], signatures[url] = log_fingerprint
+
+    clusters = cluster_signatures(signatures)
+    return pandas.DataFrame.from_records(
+        [
+            {
+                'size': len(urls),
+                'urls': urls,
+                'excerpt': excerpts[urls[0]],
+            }
+            for urls in clusters
+        ],
+        columns=['size', 'urls', 'excerpt'],
+    )
@@ -1,5 +1,10 @@
 # Copyright (c) ClusterHQ Ltd. See LICENSE for details.
 
+import errno
+import json
+import os
+import threading
+
 from twisted.python.filepath import FilePath
 
 
@@ -11,6 +16,14 @@ PASSED = u'PASSED'
 SKIPPED = u'SKIPPED'
 FIXED = u'FIXED'
 
+CONSOLE_TEXT = 'consoleText'
+TEST_REPORT = 'testReport'
+ARTIFACT_NAMES = (CONSOLE_TEXT, TEST_REPORT)
+
+# The file in the log directory that lists the artifacts that have been
+# downloaded. See ``ArtifactManifest``.
+MANIFEST_FILE = 'manifest.jsonl'
+
 
 def _child_of(file_path, url_path):
     """Return a descendant of file_path."""
@@ -26,3 +39,151 @@ def get_log_path(url):
         may have the log files for that build.
     """
     return _child_of(BASE_DIR.child('logs'), url)
+
+
+def _manifest_key(url):
+    return url.strip('/')
+
+
+def _walk_artifacts(directory, url=''):
+    """
+    Find the artifacts below a directory.
+
+    Anything that isn't named like an artifact is assumed to be a build
+    directory, so only artifacts are ``stat``-ed, rather than every entry.
+
+    :return Iterator[Tuple[str, str, int]]: the url, name and size of each
+        artifact.
+    """
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in ARTIFACT_NAMES:
+            yield url, name, os.path.getsize(path)
+        else:
+            try:
+                for artifact in _walk_artifacts(path, url + name + '/'):
+                    yield artifact
+            except OSError as e:
+                if e.errno != errno.ENOTDIR:
+                    raise
+
+
+class ArtifactManifest(object):
+    """
+    An index of which artifacts have been downloaded for which builds, and
+    how big they are.
+
+    The downloader appends an entry to a manifest file as it saves each
+    artifact, so that availability questions can be answered without a
+    ``stat`` per url per artifact, which is slow on large log trees and
+    network filesystems. Artifacts that Jenkins doesn't have are recorded
+    too, with no size, so they aren't requested again. Artifacts that are
+    found to have been removed are forgotten, so they are downloaded again.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param Optional[FilePath] path: the manifest file to read entries
+            from and record entries to. The manifest is only kept in memory
+            if this isn't provided.
+        """
+        self._path = path
+        self._artifacts = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, logs=None):
+        """
+        Load the manifest of a log directory.
+
+        If the directory doesn't have a manifest yet, one is built by
+        scanning the directory once.
+
+        :param Optional[FilePath] logs: the directory that logs are saved
+            in. Defaults to the one that ``get_log_path`` uses.
+        :return ArtifactManifest: the artifacts in that directory.
+        """
+        if logs is None:
+            logs = BASE_DIR.child('logs')
+        path = logs.child(MANIFEST_FILE)
+        if not path.exists() and logs.exists():
+            temporary = path.temporarySibling('.partial')
+            with temporary.open('wb') as f:
+                for artifact in _walk_artifacts(logs.path):
+                    f.write(json.dumps(artifact) + '\n')
+            temporary.moveTo(path)
+        manifest = cls(path)
+        manifest.update()
+        return manifest
+
+    def update(self):
+        """
+        Read any entries that have been added to the manifest file since it
+        was last read.
+        """
+        if self._path is None or not self._path.exists():
+            return
+        with self._path.open() as f:
+            f.seek(self._offset)
+            for line in f:
+                # The downloader may be half way through writing a line.
+                if not line.endswith('\n'):
+                    break
+                self._offset += len(line)
+                self._apply(json.loads(line))
+
+    def _apply(self, entry):
+        """
+        Apply a manifest entry: ``[url, name, size]`` records an artifact,
+        ``[url, name]`` forgets one.
+        """
+        artifacts = self._artifacts.setdefault(_manifest_key(entry[0]), {})
+        if len(entry) == 3:
+            artifacts[entry[1]] = entry[2]
+        else:
+            artifacts.pop(entry[1], None)
+
+    def _append(self, entry):
+        with self._lock:
+            self._apply(entry)
+            if self._path is not None:
+                with self._path.open('a') as f:
+                    f.write(json.dumps(entry) + '\n')
+
+    def record(self, url, name, size):
+        """
+        Record that an artifact has been saved, or that Jenkins doesn't
+        have it. This is safe to call from multiple threads.
+
+        :param str url: a partial url that identifies a build.
+        :param str name: the name of the artifact, e.g. ``CONSOLE_TEXT``.
+        :param Optional[int] size: the size of the artifact in bytes, or
+            ``None`` if Jenkins doesn't have it.
+        """
+        self._append([url, name, size])
+
+    def forget(self, url, name):
+        """
+        Record that an artifact that was saved has since been removed. This
+        is safe to call from multiple threads.
+
+        :param str url: a partial url that identifies a build.
+        :param str name: the name of the artifact, e.g. ``CONSOLE_TEXT``.
+        """
+        self._append([url, name])
+
+    def has(self, url, name):
+        """
+        :return bool: whether the artifact called ``name`` is available for
+            the build at ``url``.
+        """
+        artifacts = self._artifacts.get(_manifest_key(url), {})
+        return artifacts.get(name) is not None
+
+    def is_recorded(self, url, name):
+        """
+        :return bool: whether the artifact called ``name`` has either been
+            saved for the build at ``url``, or is known not to exist.
+        """
+        return name in self._artifacts.get(_manifest_key(url), {})
@@ -0,0 +1,168 @@
+"""
+Fingerprinting and near-duplicate clustering of build logs.
+
+Logs are reduced to the tail that usually explains a failure, normalized so
+that incidental details (timestamps, hostnames, IDs) don't make two
+otherwise identical failures look different, and then summarized with a
+MinHash signature. Similar signatures are found with locality-sensitive
+hashing (banding), so clustering is close to linear in the number of logs
+rather than quadratic.
+"""
+# Copyright (c) ClusterHQ Ltd. See LICENSE for details.
+
+import collections
+import re
+import zlib
+
+import numpy
+
+
+# The number of lines at the end of a log that get fingerprinted.
+TAIL_LINES = 60
+
+# The number of consecutive tokens in each shingle.
+SHINGLE_SIZE = 4
+
+# BANDS * ROWS is the number of hash functions in a signature. Two logs with
+# Jaccard similarity s share at least one band with probability
+# 1 - (1 - s ** ROWS) ** BANDS, which is ~0.5 at s = 0.6 and ~0.99 at s = 0.8.
+BANDS = 20
+ROWS = 5
+
+# Hashes are computed modulo a Mersenne prime small enough that
+# ``a * s + b`` can't overflow 64 bits, so a whole signature is computed with
+# a few numpy operations.
+_PRIME = (1 << 31) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Order matters: more specific patterns have to be replaced before the more
+# general ones (e.g. a UUID before a bare hex string or number).
+_NORMALIZERS = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?'
+                r'(Z|[+-]\d{2}:?\d{2})?'), '<TIMESTAMP>'),
+    (re.compile(r'\d{1,2}:\d{2}:\d{2}(\.\d+)?'), '<TIME>'),
+    (re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'), '<UUID>'),
+    (re.compile(r'\b(\d{1,3}\.){3}\d{1,3}(:\d+)?\b'), '<IP>'),
+    (re.compile(r'\bip-\d+-\d+-\d+-\d+\S*'), '<HOST>'),
+    (re.compile(r'\b[\w-]+(\.[\w-]+)*\.(internal|local|com|net|org)\b'),
+     '<HOST>'),
+    (re.compile(r'/tmp/\S+'), '<TMPPATH>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<ADDR>'),
+    (re.compile(r'\b[0-9a-fA-F]{8,}\b'), '<HEX>'),
+    (re.compile(r'\d+'), '<N>'),
+]
+
+_TOKEN = re.compile(r'\S+')
+
+
+def log_tail(log, lines=TAIL_LINES):
+    """
+    Return the last few non-blank lines of a log.
+
+    :param str log: the full text of a log.
+    :param int lines: the maximum number of lines to keep.
+    :return list[str]: the last ``lines`` non-blank lines of ``log``.
+    """
+    tail = [line for line in log.splitlines() if line.strip()]
+    return tail[-lines:]
+
+
+def normalize_line(line):
+    """
+    Replace the parts of a log line that vary between otherwise identical
+    failures with placeholders.
+
+    :param str line: a line of a log.
+    :return str: the normalized line.
+    """
+    for pattern, replacement in _NORMALIZERS:
+        line = pattern.sub(replacement, line)
+    return line.strip()
+
+
+def _shingles(lines):
+    """
+    Return the set of hashed token n-grams of some normalized lines.
+    """
+    tokens = _TOKEN.findall('\n'.join(lines))
+    if len(tokens) < SHINGLE_SIZE:
+        tokens = tokens + [''] * (SHINGLE_SIZE - len(tokens))
+    return set(
+        zlib.crc32(' '.join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8'))
+        & _MAX_HASH
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    )
+
+
+def _make_hash_parameters(count, seed=0):
+    rng = numpy.random.RandomState(seed)
+    a = rng.randint(1, _PRIME, size=count).astype(numpy.uint64)
+    b = rng.randint(0, _PRIME, size=count).astype(numpy.uint64)
+    # Shaped as columns, so they broadcast against a row of shingles.
+    return a[:, numpy.newaxis], b[:, numpy.newaxis]
+
+
+_HASH_A, _HASH_B = _make_hash_parameters(BANDS * ROWS)
+
+
+def minhash(lines):
+    """
+    Compute the MinHash signature of some normalized log lines.
+
+    :param list[str] lines: normalized log lines.
+    :return tuple[int]: a signature of ``BANDS * ROWS`` values. The fraction
+        of positions at which two signatures agree estimates the Jaccard
+        similarity of the shingles of the two logs.
+    """
+    shingles = numpy.fromiter(_shingles(lines), dtype=numpy.uint64)
+    hashes = (_HASH_A * (shingles % _PRIME) + _HASH_B) % _PRIME
+    return tuple(hashes.min(axis=1).tolist())
+
+
+def fingerprint(log):
+    """
+    Fingerprint the tail of a build log.
+
+    :param str log: the full text of a log.
+    :return tuple[int]: the MinHash signature of the normalized tail of the
+        log.
+    """
+    return minhash([normalize_line(line) for line in log_tail(log)])
+
+
+def _find(parents, item):
+    root = item
+    while parents[root] != root:
+        root = parents[root]
+    while parents[item] != root:
+        parents[item], item = root, parents[item]
+    return root
+
+
+def cluster_signatures(signatures):
+    """
+    Group near-duplicate signatures together.
+
+    Every signature is split into ``BANDS`` bands that are hashed into
+    buckets, and signatures that share a bucket for any band end up in the
+    same cluster. This never compares signatures pairwise.
+
+    :param Mapping[K, tuple[int]] signatures: a signature for each key.
+    :return list[list[K]]: the clusters of keys, largest first.
+    """
+    keys = list(signatures)
+    parents = list(range(len(keys)))
+    for band in range(BANDS):
+        start = band * ROWS
+        buckets = {}
+        for index, key in enumerate(keys):
+            bucket = signatures[key][start:start + ROWS]
+            first = buckets.setdefault(bucket, index)
+            if first != index:
+                parents[_find(parents, index)] = _find(parents, first)
+
+    clusters = collections.defaultdict(list)
+    for index, key in enumerate(keys):
+        clusters[_find(parents, index)].append(key)
+    return sorted(clusters.values(), key=len, reverse=True)
@@ -1,17 +1,23 @@
 # Copyright (c) ClusterHQ Ltd. See LICENSE for details.
 
+import hashlib
+import json
 import os
 
 import treq
 from twisted.internet import defer
 
+from ._common import BASE_DIR
+
 
 BASE_URL = 'http://ci-live.clusterhq.com:8080/'
 
 PASSWORD_ENV_VAR = 'JENKINS_PASSWORD'
 
+HTTP_CACHE_DIR = BASE_DIR.child('http-cache')
+
 
-def jenkins_get(path):
+def jenkins_get(path, headers=None):
     password = os.environ.get(PASSWORD_ENV_VAR, None)
     if password is None:
         raise AssertionError(
@@ -19,7 +25,7 @@ def jenkins_get(path):
             "{} env var.".format(PASSWORD_ENV_VAR)
         )
     user = os.environ.get('JENKINS_USER', 'admin')
-    return treq.get(BASE_URL + path, auth=(user, password))
+    return treq.get(BASE_URL + path, auth=(user, password), headers=headers)
 
 
 class RequestFailed(Exception):
@@ -31,26 +37,172 @@ class RequestFailed(Exception):
         return "Request failed with code {}".format(self.response.code)
 
 
-def jenkins_json_get(path):
+class CachedResponse(object):
+    """
+    A response whose body has already been read, either from the network or
+    from the local HTTP cache.
+
+    This supports the parts of the treq response interface that are used
+    here.
+    """
+
+    def __init__(self, code, body):
+        self.code = code
+        self._body = body
+
+    def content(self):
+        return defer.succeed(self._body)
+
+    def json(self):
+        return defer.succeed(json.loads(self._body))
+
+
+def _get_cache_entry(path):
+    """
+    Get the file that caches the response for path.
+
+    :param str path: the path that was requested.
+    :return FilePath: a file that may contain the cached response: a line
+        of JSON metadata followed by the body.
+    """
+    return HTTP_CACHE_DIR.child(hashlib.sha1(path).hexdigest())
+
+
+def _read_cache_entry(entry):
+    """
+    :return Optional[Tuple[dict, bytes]]: the metadata and body of a cached
+        response, or ``None`` if nothing has been cached.
+    """
+    if not entry.exists():
+        return None
+    with entry.open() as f:
+        meta = json.loads(f.readline())
+        return meta, f.read()
+
+
+def _write_cache_entry(entry, meta, body):
+    # Write to a temporary file and rename it into place, so that an
+    # interrupted write never leaves old validators with a partial body.
+    if not HTTP_CACHE_DIR.exists():
+        HTTP_CACHE_DIR.makedirs()
+    temporary = entry.temporarySibling('.partial')
+    with temporary.open('wb') as f:
+        f.write(json.dumps(meta) + '\n')
+        f.write(body)
+    temporary.moveTo(entry)
+
+
+def _first_header(resp, name):
+    values = resp.headers.getRawHeaders(name)
+    if values:
+        return values[0]
+    return None
+
+
+def _run_directly(f, *args):
+    return defer.maybeDeferred(f, *args)
+
+
+def cached_get(path, run_io=_run_directly):
+    """
+    Get path from Jenkins, using the local HTTP cache.
+
+    Cached responses are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``, so an unchanged resource costs Jenkins a 304
+    rather than the whole body.
+
+    This is for resources that change, like the build list. Artifacts of
+    finished builds never change, so the downloader doesn't request them
+    again once they are in its ``ArtifactManifest``.
+
+    :param str path: the path to get.
+    :param run_io: a function that takes a blocking function and its
+        arguments, calls it, and returns a Deferred that fires with the
+        result. The cache is read and written with this, so that it can be
+        done in a thread. By default the function is called directly.
+    :return Deferred[CachedResponse]: the response.
+    """
+    entry = _get_cache_entry(path)
+
+    def request(cached):
+        headers = {}
+        if cached is not None:
+            meta, body = cached
+            # The metadata is decoded from JSON as text, but headers have
+            # to be bytes.
+            if meta.get('etag'):
+                headers['If-None-Match'] = [meta['etag'].encode('ascii')]
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = [
+                    meta['last_modified'].encode('ascii')]
+
+        def cache_response(resp):
+            if resp.code == 304 and cached is not None:
+                meta, body = cached
+                return treq.content(resp).addCallback(
+                    lambda _: CachedResponse(meta['code'], body))
+
+            def store(body):
+                response = CachedResponse(resp.code, body)
+                if resp.code != 200:
+                    return response
+                meta = {
+                    'path': path,
+                    'code': resp.code,
+                    'etag': _first_header(resp, 'ETag'),
+                    'last_modified': _first_header(resp, 'Last-Modified'),
+                }
+                d = run_io(_write_cache_entry, entry, meta, body)
+                return d.addCallback(lambda _: response)
+            return treq.content(resp).addCallback(store)
+
+        return jenkins_get(path, headers=headers).addCallback(cache_response)
+
+    return run_io(_read_cache_entry, entry).addCallback(request)
+
+
+def jenkins_json_get(path, run_io=_run_directly):
+    """
+    Get and decode a JSON resource from Jenkins, using the local HTTP cache.
+
+    :param str path: the path to get.
+    :param run_io: how to read and write the cache; see ``cached_get``.
+    :return Deferred: fires with the decoded JSON.
+    """
     def decode_json(resp):
         if resp.code != 200:
             raise RequestFailed(resp)
         return resp.json()
-    return jenkins_get(path).addCallback(decode_json)
+    return cached_get(path, run_io).addCallback(decode_json)
+
+
+def _content_unless_404(resp):
+    if resp.code == 404:
+        return treq.content(resp).addCallback(lambda _: None)
+    if resp.code != 200:
+        raise RequestFailed(resp)
+    return treq.content(resp)
 
 
 def get_console_text(job_url):
-    def content_for_200(resp):
-        if resp.code == 200:
-            return resp.content()
-        return defer.succeed(None)
-    return jenkins_get(job_url + '/consoleText').addCallback(content_for_200)
+    """
+    Get the console log of a build.
+
+    :param str job_url: the url of the build.
+    :return Deferred[Optional[bytes]]: the log, or ``None`` if there isn't
+        one.
+    """
+    return jenkins_get(
+        job_url + '/consoleText').addCallback(_content_unless_404)
 
 
 def get_test_report(job_url):
-    def content_for_200(resp):
-        if resp.code == 200:
-            return resp.content()
-        return defer.succeed(None)
+    """
+    Get the JSON test report of a build.
+
+    :param str job_url: the url of the build.
+    :return Deferred[Optional[bytes]]: the report, or ``None`` if there
+        isn't one.
+    """
     return jenkins_get(
-        job_url + '/testReport/api/json').addCallback(content_for_200)
+        job_url + '/testReport/api/json').addCallback(_content_unless_404)
@@ -0,0 +1,70 @@
+"""
+Reading and writing snapshots of the Jenkins build API.
+
+Snapshots are stored as newline-delimited JSON, one build record per line,
+so that they can be read one build at a time rather than loading the whole
+document into memory.
+"""
+# Copyright (c) ClusterHQ Ltd. See LICENSE for details.
+
+import datetime
+import json
+
+from ._common import BASE_DIR
+
+
+def new_snapshot_path():
+    """
+    :return FilePath: the path to write a snapshot taken now to.
+    """
+    filename = 'api.' + datetime.datetime.utcnow().isoformat() + '.jsonl'
+    return BASE_DIR.child(filename)
+
+
+def find_latest_snapshot():
+    """
+    Find the most recently written snapshot.
+
+    :return Optional[FilePath]: the latest snapshot, or ``None`` if no
+        data has been downloaded.
+    """
+    # Older versions wrote the whole API document as ``api.*.json``.
+    snapshots = BASE_DIR.globChildren('api.*.json*')
+    if not snapshots:
+        return None
+    return max(snapshots, key=lambda x: x.path)
+
+
+def write_snapshot(builds, path):
+    """
+    Write build records to a snapshot, one per line.
+
+    The snapshot is written to a temporary file first, so that readers
+    never see a partially written snapshot.
+
+    :param Iterable[dict] builds: the build records to write.
+    :param FilePath path: the snapshot to write.
+    """
+    temporary = path.temporarySibling('.partial')
+    with temporary.open('wb') as f:
+        for build in builds:
+            json.dump(build, f)
+            f.write('\n')
+    temporary.moveTo(path)
+
+
+def iter_snapshot(path):
+    """
+    Read the build records in a snapshot one at a time.
+
+    :param FilePath path: the snapshot to read.
+    :return Iterator[dict]: the build records in the snapshot.
+    """
+    with path.open() as f:
+        if path.path.endswith('.json'):
+            for build in json.load(f)['builds']:
+                yield build
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
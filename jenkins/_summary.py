@@ -0,0 +1,58 @@
+"""
+Summaries of build data that don't need pandas.
+
+These are cheap to import and work in a single pass over an iterable of
+builds, so they are suitable for quick checks that shouldn't pay for
+building DataFrames.
+"""
+# Copyright (c) ClusterHQ Ltd. See LICENSE for details.
+
+import collections
+import datetime
+
+from ._common import SUCCESS, FAILURE
+
+
+def get_datetime(timestamp):
+    """
+    Return the datetime from a jenkins timestamp.
+
+    :param int timestamp: The timestamp to convert in ms since utc
+        to a datetime
+    :return datetime: The corresponding datetime.
+    """
+    return datetime.datetime.fromtimestamp(float(timestamp)/1000)
+
+
+def _get_build_result(build):
+    """
+    Aggregate all the results of the sub-builds of a build.
+    """
+    results = set(sub['result'] for sub in build['subBuilds'] if sub['result'])
+    if results == set([SUCCESS]):
+        return SUCCESS
+    else:
+        return FAILURE
+
+
+def summarize_build_results(builds):
+    return collections.Counter(map(_get_build_result, builds))
+
+
+def summarize_builds(builds):
+    """
+    Count top-level build results and failing jobs in one pass.
+
+    :param Iterable[dict] builds: an iterable of build data dicts. This is
+        only iterated once, so it can be a generator.
+    :return Tuple[Counter, Counter]: the number of top-level builds with
+        each result, and the number of failures of each job.
+    """
+    results = collections.Counter()
+    failing_jobs = collections.Counter()
+    for build in builds:
+        results[_get_build_result(build)] += 1
+        for sub_build in build['subBuilds']:
+            if sub_build['result'] == FAILURE:
+                failing_jobs[sub_build['jobName']] += 1
+    return results, failing_jobs
@@ -0,0 +1,105 @@
+# Copyright (c) ClusterHQ Ltd. See LICENSE for details.
+
+"""
+Tests for ``jenkins._common``.
+"""
+
+import json
+import tempfile
+from unittest import TestCase
+
+from twisted.python.filepath import FilePath
+
+from .._common import (
+    CONSOLE_TEXT, MANIFEST_FILE, TEST_REPORT, ArtifactManifest,
+)
+
+
+URL = 'job/flocker/job/run_trial/12/'
+OTHER_URL = 'job/flocker/job/run_trial/13/'
+
+
+class ArtifactManifestTests(TestCase):
+    """
+    Tests for ``ArtifactManifest``.
+    """
+
+    def setUp(self):
+        self.logs = FilePath(tempfile.mkdtemp())
+        self.addCleanup(self.logs.remove)
+
+    def test_load_builds_manifest(self):
+        """
+        Loading a log directory without a manifest finds the artifacts in
+        it, and writes a manifest of them.
+        """
+        build = self.logs.preauthChild(URL)
+        build.makedirs()
+        build.child(CONSOLE_TEXT).setContent('log')
+        manifest = ArtifactManifest.load(self.logs)
+        self.assertEqual(
+            (True, False),
+            (manifest.has(URL, CONSOLE_TEXT), manifest.has(URL, TEST_REPORT)))
+        self.assertTrue(self.logs.child(MANIFEST_FILE).exists())
+
+    def test_update_reads_appended_entries(self):
+        """
+        ``update`` only reads the entries that have been added to the
+        manifest file since it was last read.
+        """
+        manifest = ArtifactManifest.load(self.logs)
+        writer = ArtifactManifest.load(self.logs)
+        writer.record(URL, CONSOLE_TEXT, 3)
+        manifest.update()
+        # Change the entry that has already been read, without changing its
+        # length, so reading it again would be noticed.
+        path = self.logs.child(MANIFEST_FILE)
+        path.setContent(path.getContent().replace(URL, OTHER_URL))
+        writer.record(URL, TEST_REPORT, 2)
+        manifest.update()
+        self.assertEqual(
+            (True, True, False),
+            (manifest.has(URL, CONSOLE_TEXT), manifest.has(URL, TEST_REPORT),
+             manifest.is_recorded(OTHER_URL, CONSOLE_TEXT)))
+
+    def test_update_skips_partial_line(self):
+        """
+        A line that is still being written is read once it is complete.
+        """
+        manifest = ArtifactManifest.load(self.logs)
+        line = json.dumps([URL, CONSOLE_TEXT, 3]) + '\n'
+        path = self.logs.child(MANIFEST_FILE)
+        with path.open('a') as f:
+            f.write(line[:10])
+        manifest.update()
+        self.assertFalse(manifest.is_recorded(URL, CONSOLE_TEXT))
+        with path.open('a') as f:
+            f.write(line[10:])
+        manifest.update()
+        self.assertTrue(manifest.has(URL, CONSOLE_TEXT))
+
+    def test_missing_artifact(self):
+        """
+        An artifact that Jenkins doesn't have is recorded, but isn't
+        available.
+        """
+        manifest = ArtifactManifest()
+        manifest.record(URL, TEST_REPORT, None)
+        self.assertEqual(
+            (True, False),
+            (manifest.is_recorded(URL, TEST_REPORT),
+             manifest.has(URL, TEST_REPORT)))
+
+    def test_forget(self):
+        """
+        A forgotten artifact is neither available nor recorded, so it is
+        downloaded again.
+        """
+        manifest = ArtifactManifest.load(self.logs)
+        manifest.record(URL, CONSOLE_TEXT, 3)
+        manifest.forget(URL, CONSOLE_TEXT)
+        reloaded = ArtifactManifest.load(self.logs)
+        self.assertEqual(
+            (False, False),
+            (reloaded.is_recorded(URL, CONSOLE_TEXT),
+             reloaded.has(URL, CONSOLE_TEXT)))
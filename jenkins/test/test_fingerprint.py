@@ -0,0 +1,128 @@
+# Copyright (c) ClusterHQ Ltd. See LICENSE for details.
+
+"""
+Tests for ``jenkins._fingerprint``.
+"""
+
+from unittest import TestCase
+
+from .._fingerprint import cluster_signatures, fingerprint, normalize_line
+
+
+FAILURE_LOG = '\n'.join([
+    '2016-01-12 10:11:12.123 Running acceptance tests on ip-10-0-1-2',
+    'Connecting to 172.16.3.4:22',
+    'Creating dataset 0d2c0b5e-4c8b-4b3a-9f8e-3a1b2c3d4e5f',
+    'Traceback (most recent call last):',
+    '  File "/tmp/tmpa8sd7f/flocker/node/agents/ebs.py", line 312, in attach',
+    'ValueError: volume vol-1a2b3c4d5e in state attaching after 300 seconds',
+    'FAILED (failures=3, errors=1)',
+])
+
+OTHER_LOG = '\n'.join([
+    'Collecting docutils>=0.10',
+    'Downloading from URL https://pypi.python.org/packages/docutils',
+    'pkg_resources.DistributionNotFound: The docutils distribution was not',
+    'found and is required by sphinx',
+    "Build step 'Execute shell' marked build as failure",
+    'Finished: FAILURE',
+])
+
+
+def _vary(log):
+    """
+    Change the incidental details of ``FAILURE_LOG``, like a later run of
+    the same failure would.
+    """
+    for old, new in [
+        ('2016-01-12 10:11:12.123', '2016-02-03 23:01:59.987'),
+        ('ip-10-0-1-2', 'ip-10-0-7-88'),
+        ('172.16.3.4', '172.16.9.201'),
+        ('0d2c0b5e-4c8b-4b3a-9f8e-3a1b2c3d4e5f',
+         '9e8d7c6b-5a4f-4e3d-8c2b-1a0f9e8d7c6b'),
+        ('tmpa8sd7f', 'tmpq0w9e8'),
+        ('1a2b3c4d5e', '9f8e7d6c5b'),
+        ('failures=3, errors=1', 'failures=5, errors=2'),
+    ]:
+        log = log.replace(old, new)
+    return log
+
+
+class NormalizeLineTests(TestCase):
+    """
+    Tests for ``normalize_line``.
+    """
+
+    def test_timestamp(self):
+        self.assertEqual(
+            '<TIMESTAMP> Starting',
+            normalize_line('2016-01-12T10:11:12.123Z Starting'))
+
+    def test_time(self):
+        self.assertEqual(
+            '[<TIME>] Starting', normalize_line('[10:11:12] Starting'))
+
+    def test_uuid(self):
+        self.assertEqual(
+            'dataset <UUID> created',
+            normalize_line(
+                'dataset 0d2c0b5e-4c8b-4b3a-9f8e-3a1b2c3d4e5f created'))
+
+    def test_ip_and_port(self):
+        self.assertEqual(
+            'connect to <IP> failed',
+            normalize_line('connect to 10.0.1.2:8080 failed'))
+
+    def test_hostnames(self):
+        self.assertEqual(
+            'on <HOST> and <HOST>',
+            normalize_line(
+                'on ip-10-0-1-2 and ec2-1-2-3-4.compute.internal'))
+
+    def test_hex_and_numbers(self):
+        self.assertEqual(
+            'object at <ADDR>, commit <HEX>, <N> retries',
+            normalize_line(
+                'object at 0x7f3a2b1c, commit 3f2a9c8d1e, 12 retries'))
+
+    def test_variations_are_equal(self):
+        """
+        Lines that only differ in incidental details normalize to the same
+        thing.
+        """
+        self.assertEqual(
+            [normalize_line(line) for line in FAILURE_LOG.splitlines()],
+            [normalize_line(line) for line in _vary(FAILURE_LOG).splitlines()])
+
+
+class ClusterSignaturesTests(TestCase):
+    """
+    Tests for ``cluster_signatures``.
+    """
+
+    def test_near_duplicates_merge(self):
+        """
+        Logs of the same failure end up in the same cluster, and unrelated
+        logs end up in a cluster of their own.
+        """
+        signatures = {
+            'a': fingerprint(FAILURE_LOG),
+            'b': fingerprint(_vary(FAILURE_LOG)),
+            'c': fingerprint(FAILURE_LOG + '\nRetrying in 5 seconds'),
+            'other': fingerprint(OTHER_LOG),
+        }
+        self.assertEqual(
+            [['a', 'b', 'c'], ['other']],
+            [sorted(cluster) for cluster in cluster_signatures(signatures)])
+
+    def test_unrelated_logs_stay_apart(self):
+        signatures = {
+            'a': fingerprint(FAILURE_LOG),
+            'other': fingerprint(OTHER_LOG),
+        }
+        self.assertEqual(
+            [['a'], ['other']],
+            sorted(cluster_signatures(signatures)))
+
+    def test_empty(self):
+        self.assertEqual([], cluster_signatures({}))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+"""
+Serve the analysis reports as JSON from a long-running process.
+
+The build data is loaded, and the failures classified, once. The frames are
+kept in memory and refreshed periodically, reusing the classification of
+any failure that has been seen before, so each query only has to filter and
+summarize frames that are already built.
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from datetime import timedelta
+import sys
+
+import dateutil.parser
+import dateutil.tz
+import pandas
+from twisted.internet import defer
+from twisted.internet.task import LoopingCall, react
+from twisted.internet.threads import deferToThread
+from twisted.python import log
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from jenkins._analysis import (
+    MISSING_LOG,
+    _classify,
+    analyze_failing_tests,
+    get_classified_failures,
+    get_daily_classification_pivot,
+    get_daily_time_to_merge,
+    get_top_failing_jobs,
+    group_by_classification,
+    group_by_test_name,
+    make_subbuild_data_frame,
+)
+from jenkins._common import TEST_REPORT, ArtifactManifest
+from jenkins._snapshot import find_latest_snapshot, iter_snapshot
+
+
+DEFAULT_PORT = 8765
+
+# How often, in seconds, to check for a new snapshot and newly downloaded
+# logs. A refresh that takes longer than this delays the next one.
+REFRESH_INTERVAL = 60
+
+
+class AnalysisFrames(object):
+    """
+    The analysis frames for the latest snapshot, kept up to date.
+
+    :ivar pandas.DataFrame build_data: the sub-builds in the latest snapshot.
+    :ivar pandas.DataFrame failures: the failing sub-builds, classified.
+    :ivar pandas.DataFrame failing_tests: the individual failing tests.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.build_data = None
+        self.failures = None
+        self.failing_tests = None
+        self._classifications = {}
+        self._manifest = None
+        self._analysed_urls = set()
+        self._known_failing_tests = analyze_failing_tests(
+            pandas.DataFrame(columns=['url', 'result']), ArtifactManifest())
+
+    def _classify(self, url, manifest):
+        classification = self._classifications.get(url)
+        if classification is None:
+            classification = _classify(url, manifest)
+            # Logs are downloaded after the snapshot is written, so a
+            # missing log might turn up later.
+            if classification != MISSING_LOG:
+                self._classifications[url] = classification
+        return classification
+
+    def refresh(self):
+        """
+        Analyse the latest snapshot in a thread, so that queries are still
+        answered meanwhile, and then swap the new frames in.
+
+        :return Deferred: fires when the frames have been refreshed. Errors
+            are logged rather than returned, so that a failed refresh
+            doesn't stop later ones.
+        """
+        d = deferToThread(self._analyse)
+        d.addCallback(self._swap)
+        d.addErrback(log.err, "Failed to refresh the analysis frames")
+        return d
+
+    def _analyse(self):
+        """
+        Load the latest snapshot, if it is new, and analyse any failures
+        that haven't been analysed yet.
+
+        This runs in a thread, so it doesn't change the public attributes.
+
+        :return Optional[tuple]: the new snapshot and frames, or ``None``
+            if no data has been downloaded.
+        """
+        snapshot = find_latest_snapshot()
+        if snapshot is None:
+            return None
+        build_data = self.build_data
+        if snapshot != self.snapshot:
+            build_data = make_subbuild_data_frame(iter_snapshot(snapshot))
+
+        if self._manifest is None:
+            self._manifest = ArtifactManifest.load()
+        else:
+            self._manifest.update()
+        manifest = self._manifest
+        failures = get_classified_failures(
+            build_data, manifest=manifest, classify=self._classify)
+
+        known = self._known_failing_tests
+        pending = failures[~failures['url'].isin(self._analysed_urls)]
+        if len(pending):
+            known = pandas.concat(
+                [known, analyze_failing_tests(pending, manifest)])
+            self._known_failing_tests = known
+            # A test report might still be downloaded for the others.
+            self._analysed_urls.update(
+                url for url in pending['url']
+                if manifest.is_recorded(url, TEST_REPORT))
+        failing_tests = known[known['url'].isin(failures['url'])]
+        return snapshot, build_data, failures, failing_tests
+
+    def _swap(self, analysis):
+        if analysis is None:
+            return
+        snapshot, build_data, failures, failing_tests = analysis
+        if snapshot != self.snapshot:
+            print("Loaded", snapshot.path)
+        self.snapshot = snapshot
+        self.build_data = build_data
+        self.failures = failures
+        self.failing_tests = failing_tests
+
+
+def _filter_builds(frame, since, job):
+    if since is not None:
+        frame = frame[frame['datetime'] > since]
+    if job is not None:
+        frame = frame[frame['job'] == job]
+    return frame
+
+
+def top_failing_jobs(frames, since, job):
+    return get_top_failing_jobs(_filter_builds(frames.build_data, since, job))
+
+
+def classifications(frames, since, job):
+    return group_by_classification(
+        _filter_builds(frames.failures, since, job))
+
+
+def daily_classifications(frames, since, job):
+    failures = _filter_builds(frames.failures, since, job)
+    if failures.empty:
+        return pandas.DataFrame()
+    return get_daily_classification_pivot(failures)
+
+
+def failing_tests(frames, since, job):
+    urls = _filter_builds(frames.failures, since, job)['url']
+    tests = frames.failing_tests
+    return group_by_test_name(tests[tests['url'].isin(urls)])
+
+
+def daily_time_to_merge(frames, since, job):
+    build_data = _filter_builds(frames.build_data, since, job)
+    if build_data.empty:
+        return pandas.Series()
+    # Durations are reported in seconds; to_json would render them as
+    # dates.
+    return get_daily_time_to_merge(build_data).map(
+        lambda x: x.total_seconds() if isinstance(x, timedelta) else x)
+
+
+REPORTS = {
+    'top-failing-jobs': top_failing_jobs,
+    'classifications': classifications,
+    'daily-classifications': daily_classifications,
+    'failing-tests': failing_tests,
+    'daily-time-to-merge': daily_time_to_merge,
+}
+
+
+class ReportResource(Resource):
+    """
+    A report about the current frames, rendered as JSON.
+
+    Accepts ``since`` (a date) and ``job`` (a job name) query parameters
+    to restrict the builds that are reported on.
+    """
+
+    isLeaf = True
+
+    def __init__(self, frames, report):
+        Resource.__init__(self)
+        self._frames = frames
+        self._report = report
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        if self._frames.build_data is None:
+            request.setResponseCode(503)
+            return '{"error": "No data has been downloaded"}'
+        since = request.args.get('since', [None])[0]
+        job = request.args.get('job', [None])[0]
+        if since is not None:
+            try:
+                since = dateutil.parser.parse(since)
+            except ValueError:
+                request.setResponseCode(400)
+                return '{"error": "Invalid since"}'
+            if since.tzinfo is not None:
+                # Build times are naive local times, see get_datetime.
+                since = since.astimezone(dateutil.tz.tzlocal()).replace(
+                    tzinfo=None)
+        try:
+            result = self._report(self._frames, since, job)
+            return result.to_json(orient='split', date_format='iso')
+        except Exception:
+            log.err(None, "Failed to render report")
+            request.setResponseCode(500)
+            return '{"error": "Failed to render report"}'
+
+
+def make_site(frames):
+    root = Resource()
+    for name, report in REPORTS.items():
+        root.putChild(name, ReportResource(frames, report))
+    site = Site(root)
+    # Errors are reported as JSON, never as HTML tracebacks.
+    site.displayTracebacks = False
+    return site
+
+
+def main(reactor, *argv):
+    parser = ArgumentParser(
+        'serve_data.py', description="Serve Jenkins build analysis as JSON"
+    )
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help="The port to listen on"
+    )
+    parser.add_argument(
+        '--interface', default='127.0.0.1',
+        help="The interface to listen on"
+    )
+    opts = parser.parse_args(argv)
+    log.startLogging(sys.stdout)
+
+    frames = AnalysisFrames()
+    LoopingCall(frames.refresh).start(REFRESH_INTERVAL)
+    reactor.listenTCP(opts.port, make_site(frames), interface=opts.interface)
+    print("Serving on http://{}:{}/".format(opts.interface, opts.port))
+    return defer.Deferred()
+
+
+if __name__ == '__main__':
+    react(main, sys.argv[1:])